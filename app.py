@@ -3,10 +3,19 @@ Main Flask application for the generic matching app.
 Configures the app, database, login manager, and routes.
 """
 import os
-from flask import Flask, render_template, redirect, url_for
+import sqlite3
+from datetime import datetime, timezone
+import orjson
+from flask import Flask, render_template, redirect, url_for, g
+from flask.json.provider import DefaultJSONProvider
 from flask_login import LoginManager, login_required, current_user
 from flask_wtf.csrf import CSRFProtect
-from models import db, User
+from flask_compress import Compress
+from sqlalchemy import select, func, or_, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+from models import db, User, Profile, Like, Match, create_missing_indexes
+from extensions import cache
 # Import forms is handled by route blueprints
 
 # Import route blueprints
@@ -16,22 +25,136 @@ from routes.match import match_bp
 from routes.chat import chat_bp
 
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection for a write-light web workload.
+    
+    WAL lets readers proceed during writes and, with synchronous=NORMAL,
+    commits no longer fsync the rollback journal on every transaction.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA cache_size=-65536')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.close()
+
+
+def format_timeago(dt, now):
+    """Describe how long before ``now`` the datetime ``dt`` was."""
+    if not dt:
+        return ''
+    
+    if dt.tzinfo is None:
+        # Assume UTC if no timezone info
+        dt = dt.replace(tzinfo=timezone.utc)
+    
+    seconds = int((now - dt).total_seconds())
+    
+    if seconds >= 86400:
+        days = seconds // 86400
+        return f"{days} day{'s' if days != 1 else ''} ago"
+    elif seconds > 3600:
+        hours = seconds // 3600
+        return f"{hours} hour{'s' if hours != 1 else ''} ago"
+    elif seconds > 60:
+        minutes = seconds // 60
+        return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
+    else:
+        return "Just now"
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson.
+    
+    orjson serializes datetimes natively as ISO 8601; anything it can't
+    handle falls back to Flask's default conversions.
+    """
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        # orjson has no object_hook, which the session serializer relies on
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def _engine_options(uri):
+    """Return connection pool settings for a database URI.
+    
+    Keep a pool of open connections so requests don't pay the connect/close
+    cost; pre-ping and recycling keep pooled server connections valid. SQLite
+    files also get sqlite3 connect arguments: pooled connections are shared
+    across threads, and the timeout lets writers wait on the WAL lock.
+    In-memory SQLite gets nothing, since Flask-SQLAlchemy keeps it on a
+    single static connection.
+    """
+    url = make_url(uri)
+    options = {
+        'poolclass': QueuePool,
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory':
+            return {}
+        options['connect_args'] = {'check_same_thread': False, 'timeout': 30}
+    return options
+
+
 def create_app(config=None):
     """Application factory pattern."""
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
     
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production')
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///matching_app.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['WTF_CSRF_ENABLED'] = True
+    app.config['CACHE_REDIS_URL'] = os.environ.get('REDIS_URL')
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+    # Brotli for clients that accept it, gzip otherwise; tiny responses
+    # aren't worth the CPU. Only the JSON APIs are compressed: HTML pages
+    # carry the CSRF token next to user-supplied text, which compression
+    # would expose to BREACH-style attacks.
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app.config['COMPRESS_MIMETYPES'] = ['application/json', 'application/x-ndjson']
+    app.config['COMPRESS_MIN_SIZE'] = 500
     
     if config:
         app.config.update(config)
     
+    # Applied after ``config`` so callers can override it
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    # Redis when REDIS_URL is set. Without it, caching is off: a per-process
+    # cache can't be invalidated across workers, so other workers would keep
+    # serving stale profiles and discover feeds. Debug mode (FLASK_DEBUG)
+    # and tests use an in-memory cache.
+    if app.config['CACHE_REDIS_URL']:
+        app.config.setdefault('CACHE_TYPE', 'RedisCache')
+    elif app.debug or app.testing:
+        app.config.setdefault('CACHE_TYPE', 'SimpleCache')
+    else:
+        app.config.setdefault('CACHE_TYPE', 'NullCache')
+    
     # Initialize extensions
     db.init_app(app)
+    cache.init_app(app)
     csrf = CSRFProtect(app)
+    Compress(app)
     
     # Setup Flask-Login
     login_manager = LoginManager()
@@ -42,7 +165,7 @@ def create_app(config=None):
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return db.session.get(User, int(user_id))
     
     # Register blueprints
     app.register_blueprint(auth_bp)
@@ -65,17 +188,27 @@ def create_app(config=None):
     @login_required
     def dashboard():
         """User dashboard with quick stats."""
-        matches_count = len(current_user.get_matches())
+        # Fetch all counters in one round-trip using scalar subqueries
+        matches_count = select(func.count(Match.id)).where(
+            or_(Match.user1_id == current_user.id, Match.user2_id == current_user.id)
+        ).scalar_subquery()
+        likes_given = select(func.count(Like.id)).where(
+            Like.user_id == current_user.id
+        ).scalar_subquery()
+        likes_received = select(func.count(Like.id)).where(
+            Like.liked_user_id == current_user.id
+        ).scalar_subquery()
         
-        # Count likes given and received
-        from models import Like
-        likes_given = Like.query.filter_by(user_id=current_user.id).count()
-        likes_received = Like.query.filter_by(liked_user_id=current_user.id).count()
+        row = db.session.execute(select(
+            matches_count.label('matches_count'),
+            likes_given.label('likes_given'),
+            likes_received.label('likes_received')
+        )).one()
         
         stats = {
-            'matches_count': matches_count,
-            'likes_given': likes_given,
-            'likes_received': likes_received
+            'matches_count': row.matches_count,
+            'likes_given': row.likes_given,
+            'likes_received': row.likes_received
         }
         
         return render_template('dashboard.html', stats=stats)
@@ -98,35 +231,37 @@ def create_app(config=None):
             return dt.strftime('%Y-%m-%d %H:%M')
         return ''
     
+    @app.before_request
+    def cache_request_time():
+        """Take one timestamp per request for the timeago filter."""
+        g.request_now = datetime.now(timezone.utc)
+    
     @app.template_filter('timeago')
     def timeago_filter(dt):
         """Simple time ago filter."""
-        if not dt:
-            return ''
-        
-        from datetime import datetime, timezone
-        now = datetime.now(timezone.utc)
-        if dt.tzinfo is None:
-            # Assume UTC if no timezone info
-            dt = dt.replace(tzinfo=timezone.utc)
-        
-        diff = now - dt
-        
-        if diff.days > 0:
-            return f"{diff.days} day{'s' if diff.days != 1 else ''} ago"
-        elif diff.seconds > 3600:
-            hours = diff.seconds // 3600
-            return f"{hours} hour{'s' if hours != 1 else ''} ago"
-        elif diff.seconds > 60:
-            minutes = diff.seconds // 60
-            return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
-        else:
-            return "Just now"
-    
-    # Create database tables
-    with app.app_context():
+        return format_timeago(dt, g.get('request_now') or datetime.now(timezone.utc))
+    
+    @app.template_global('bulk_timeago')
+    def bulk_timeago(datetimes):
+        """Format a whole sequence of datetimes against one shared timestamp."""
+        now = g.get('request_now') or datetime.now(timezone.utc)
+        return [format_timeago(dt, now) for dt in datetimes]
+    
+    # Database schema setup (run once, not on every worker import)
+    @app.cli.command('init-db')
+    def init_db():
+        """Create database tables, upgrade older ones (columns and indexes) and backfill missing profiles."""
         db.create_all()
         print("Database tables created successfully!")
+        added = Match.add_message_columns()
+        if added:
+            print(f"Added and backfilled match columns: {', '.join(added)}.")
+        indexes = create_missing_indexes()
+        if indexes:
+            print(f"Created indexes: {', '.join(indexes)}.")
+        backfilled = Profile.backfill_missing()
+        if backfilled:
+            print(f"Created {backfilled} missing profile(s).")
     
     return app
 
@@ -135,6 +270,10 @@ def create_app(config=None):
 app = create_app()
 
 if __name__ == '__main__':
+    # Make sure tables exist for the development server
+    with app.app_context():
+        db.create_all()
+    
     # Run the app
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
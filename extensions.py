@@ -0,0 +1,6 @@
+"""
+Flask extension instances shared between the app factory and route blueprints.
+"""
+from flask_caching import Cache
+
+cache = Cache()
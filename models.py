@@ -4,10 +4,47 @@ Defines User, Profile, Like, Match, and Message models with SQLAlchemy ORM.
 """
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from sqlalchemy import and_, or_, select, update, case, type_coerce, lambda_stmt
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import with_expression
 
 db = SQLAlchemy()
+password_hasher = PasswordHasher()
+
+
+def _dialect_insert():
+    """Return the ``insert`` construct for the bound database dialect.
+    
+    Only the SQLite and PostgreSQL variants support ``on_conflict_do_nothing``.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert
+    return sqlite.insert
+
+
+def create_missing_indexes():
+    """Create any model index the database doesn't have yet.
+    
+    ``create_all`` skips tables that already exist, so indexes added to a
+    model after its table was created are only built here. Returns the
+    names of the indexes created.
+    """
+    existing = set()
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing.update(index['name'] for index in inspector.get_indexes(table.name))
+    
+    created = []
+    for table in db.metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(db.engine, checkfirst=True)
+                created.append(index.name)
+    return created
+
 
 class User(UserMixin, db.Model):
     """User model for authentication and core user data."""
@@ -16,9 +53,18 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(200), nullable=False)
-    active = db.Column(db.Boolean, default=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    # Defaults are set both ways here and below: server defaults for rows
+    # inserted outside the ORM, and insert-time defaults so databases
+    # created before the server defaults existed keep working
+    active = db.Column(db.Boolean, default=True, server_default=db.true(), nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), server_default=db.func.current_timestamp())
+    last_seen = db.Column(db.DateTime, default=db.func.current_timestamp(), server_default=db.func.current_timestamp())
+    
+    # Partial index over active users only, for the discover filter
+    __table_args__ = (
+        db.Index('ix_user_active', 'id',
+                 sqlite_where=active == db.true(), postgresql_where=active == db.true()),
+    )
     
     @property
     def is_active(self):
@@ -26,25 +72,73 @@ class User(UserMixin, db.Model):
         return self.active
     
     # Relationships
-    profile = db.relationship('Profile', backref='user', uselist=False, cascade='all, delete-orphan')
+    profile = db.relationship('Profile', back_populates='user', uselist=False, lazy='joined', cascade='all, delete-orphan')
     likes_given = db.relationship('Like', foreign_keys='Like.user_id', backref='user', cascade='all, delete-orphan')
-    matches_as_user1 = db.relationship('Match', foreign_keys='Match.user1_id', backref='user1', cascade='all, delete-orphan')
-    matches_as_user2 = db.relationship('Match', foreign_keys='Match.user2_id', backref='user2', cascade='all, delete-orphan')
+    matches_as_user1 = db.relationship('Match', foreign_keys='Match.user1_id', backref=db.backref('user1', lazy='joined'), cascade='all, delete-orphan')
+    matches_as_user2 = db.relationship('Match', foreign_keys='Match.user2_id', backref=db.backref('user2', lazy='joined'), cascade='all, delete-orphan')
     messages_sent = db.relationship('Message', foreign_keys='Message.sender_id', backref='sender', cascade='all, delete-orphan')
     
+    @staticmethod
+    def get_by_email(email):
+        """Look up a user by email address.
+        
+        Built as a lambda statement so the query is constructed and compiled
+        once and later calls only bind the new email value.
+        """
+        stmt = lambda_stmt(lambda: select(User).where(User.email == email).limit(1))
+        return db.session.scalars(stmt).first()
+    
     def set_password(self, password):
-        """Hash and set the user's password."""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set the user's password with Argon2."""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check if provided password matches the stored hash."""
-        return check_password_hash(self.password_hash, password)
+        """Check if provided password matches the stored hash.
+        
+        Legacy Werkzeug (pbkdf2/scrypt) hashes and Argon2 hashes with
+        outdated parameters are rehashed on a successful check; the caller
+        must commit to persist the new hash.
+        """
+        if not self.password_hash.startswith('$argon2'):
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
-    def get_matches(self):
-        """Get all matches for this user."""
-        matches1 = Match.query.filter_by(user1_id=self.id).all()
-        matches2 = Match.query.filter_by(user2_id=self.id).all()
-        return matches1 + matches2
+    def get_matches(self, options=(), before=None, limit=None):
+        """Get matches for this user, newest first.
+        
+        ``options`` are ORM loader options applied to the query. ``before``
+        is a ``(created_at_stored, id)`` keyset cursor taken from a match
+        returned here; only matches older than it are returned, at most
+        ``limit`` of them.
+        """
+        # SQLite stores timestamps as text, in different formats depending
+        # on whether the database or the ORM filled them in; a bound datetime
+        # doesn't compare reliably against that, so cursors carry and compare
+        # the stored text, which is also what ORDER BY sorts on
+        stored_created_at = type_coerce(Match.created_at, db.String)
+        query = Match.query.options(
+            with_expression(Match.created_at_stored, stored_created_at), *options
+        ).filter(
+            or_(Match.user1_id == self.id, Match.user2_id == self.id)
+        )
+        if before is not None:
+            created_at, match_id = before
+            query = query.filter(or_(
+                stored_created_at < created_at,
+                and_(stored_created_at == created_at, Match.id < match_id)
+            ))
+        return query.order_by(Match.created_at.desc(), Match.id.desc()).limit(limit).all()
     
     def get_match_with_user(self, other_user_id):
         """Check if this user has a match with another user."""
@@ -75,13 +169,30 @@ class Profile(db.Model):
     bio = db.Column(db.Text, nullable=True)
     tags = db.Column(db.String(500), nullable=True)  # Comma-separated tags
     location = db.Column(db.String(100), nullable=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    # Partial index over named profiles only, for the discover filter
+    __table_args__ = (
+        db.Index('ix_profile_named', 'user_id',
+                 sqlite_where=name != '', postgresql_where=name != ''),
+    )
+    
+    # Relationships
+    user = db.relationship('User', back_populates='profile', lazy='joined')
     
-    def get_tags_list(self):
-        """Return tags as a list."""
-        if self.tags:
-            return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
-        return []
+    @property
+    def tags_list(self):
+        """Return tags as a list.
+        
+        The parsed list is cached against the raw ``tags`` string, so
+        repeated calls while rendering a profile don't re-split it and any
+        change to ``tags`` is picked up automatically.
+        """
+        cached = self.__dict__.get('_tags_list_cache')
+        if cached is None or cached[0] != self.tags:
+            tags = [tag.strip() for tag in self.tags.split(',') if tag.strip()] if self.tags else []
+            cached = self._tags_list_cache = (self.tags, tags)
+        return cached[1]
     
     def set_tags_from_list(self, tags_list):
         """Set tags from a list of strings."""
@@ -92,6 +203,33 @@ class Profile(db.Model):
     
     def __repr__(self):
         return f'<Profile {self.name}>'
+    
+    @staticmethod
+    def backfill_missing():
+        """Create empty profiles for users that don't have one.
+        
+        Users created before profiles were attached at signup may lack one;
+        this fills them in with a single INSERT ... SELECT.
+        """
+        missing = select(User.id, db.literal('')).where(
+            ~db.exists().where(Profile.user_id == User.id)
+        )
+        result = db.session.execute(
+            db.insert(Profile).from_select(['user_id', 'name'], missing)
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+@db.event.listens_for(User, 'init')
+def create_default_profile(target, args, kwargs):
+    """Give every new user an empty profile, inserted in the same flush.
+    
+    This keeps profile creation out of the read paths: pages can rely on
+    ``user.profile`` existing instead of creating it on first visit.
+    """
+    if 'profile' not in kwargs:
+        target.profile = Profile(name='')
 
 
 class Like(db.Model):
@@ -101,45 +239,56 @@ class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     liked_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), server_default=db.func.current_timestamp())
     
-    # Ensure a user can't like the same person twice
-    __table_args__ = (db.UniqueConstraint('user_id', 'liked_user_id', name='unique_like'),)
+    # Ensure a user can't like the same person twice. The unique constraint
+    # also indexes (user_id, liked_user_id); the reverse index serves lookups
+    # and counts by the liked user.
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'liked_user_id', name='unique_like'),
+        db.Index('ix_like_liked_user', 'liked_user_id', 'user_id'),
+    )
     
     @staticmethod
     def create_like_and_check_match(user_id, liked_user_id):
-        """Create a like and check if it results in a match."""
+        """Create a like and check if it results in a match.
+        
+        Uses INSERT ... ON CONFLICT DO NOTHING for both the like and the
+        match, so the whole operation is two statements in one transaction
+        and concurrent likes cannot race between a read and a write.
+        """
         # Don't allow self-likes
         if user_id == liked_user_id:
             return None, False
         
-        # Check if like already exists
-        existing_like = Like.query.filter_by(user_id=user_id, liked_user_id=liked_user_id).first()
-        if existing_like:
+        insert = _dialect_insert()
+        
+        # Create the like; nothing is returned if it already exists
+        new_like = db.session.scalars(
+            insert(Like)
+            .values(user_id=user_id, liked_user_id=liked_user_id)
+            .on_conflict_do_nothing()
+            .returning(Like)
+        ).first()
+        if new_like is None:
+            existing_like = db.session.scalars(select(Like).filter_by(user_id=user_id, liked_user_id=liked_user_id)).first()
             return existing_like, False
         
-        # Create the like
-        new_like = Like(user_id=user_id, liked_user_id=liked_user_id)
-        db.session.add(new_like)
-        
-        # Check if the other user has already liked back
-        reverse_like = Like.query.filter_by(user_id=liked_user_id, liked_user_id=user_id).first()
-        
-        match_created = False
-        if reverse_like:
-            # Create a match
-            existing_match = Match.query.filter(
-                ((Match.user1_id == user_id) & (Match.user2_id == liked_user_id)) |
-                ((Match.user1_id == liked_user_id) & (Match.user2_id == user_id))
-            ).first()
-            
-            if not existing_match:
-                new_match = Match(
-                    user1_id=min(user_id, liked_user_id),
-                    user2_id=max(user_id, liked_user_id)
-                )
-                db.session.add(new_match)
-                match_created = True
+        # Create the match only if the other user has already liked back
+        reverse_like = db.select(Like.id).where(
+            Like.user_id == liked_user_id,
+            Like.liked_user_id == user_id
+        ).exists()
+        match_source = db.select(
+            db.literal(min(user_id, liked_user_id)),
+            db.literal(max(user_id, liked_user_id))
+        ).where(reverse_like)
+        result = db.session.execute(
+            insert(Match)
+            .from_select(['user1_id', 'user2_id'], match_source)
+            .on_conflict_do_nothing()
+        )
+        match_created = result.rowcount > 0
         
         db.session.commit()
         return new_like, match_created
@@ -155,25 +304,111 @@ class Match(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user1_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     user2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), server_default=db.func.current_timestamp())
+    # Denormalized from messages and kept up to date by Message.create and
+    # mark_read_by, so match listings don't aggregate over messages
+    unread_for_user1 = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    unread_for_user2 = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    # created_at exactly as stored, loaded by User.get_matches for
+    # pagination cursors
+    created_at_stored = db.query_expression()
     
     # Relationships
     messages = db.relationship('Message', backref='match', cascade='all, delete-orphan')
     
-    # Ensure unique matches (user1_id should always be less than user2_id)
-    __table_args__ = (db.UniqueConstraint('user1_id', 'user2_id', name='unique_match'),)
+    # Ensure unique matches (user1_id should always be less than user2_id).
+    # The unique constraint already indexes user1_id; user2_id needs its own
+    # index so both sides of the OR in User.get_matches are index lookups.
+    __table_args__ = (
+        db.UniqueConstraint('user1_id', 'user2_id', name='unique_match'),
+        db.Index('ix_match_user2', 'user2_id'),
+    )
     
     def get_other_user(self, current_user_id):
         """Get the other user in this match."""
+        # Both users are joined-loaded with the match, so no query is issued
         if self.user1_id == current_user_id:
-            return User.query.get(self.user2_id)
+            return self.user2
         elif self.user2_id == current_user_id:
-            return User.query.get(self.user1_id)
+            return self.user1
         return None
     
-    def get_messages(self, limit=50):
-        """Get messages for this match, ordered by creation time."""
-        return Message.query.filter_by(match_id=self.id).order_by(Message.created_at.asc()).limit(limit).all()
+    @staticmethod
+    def add_message_columns():
+        """Add the denormalized message columns to an older matches table.
+        
+        Databases created before the columns existed get them with ALTER
+        TABLE, then have them filled from messages in a single UPDATE.
+        Returns the names of the columns added.
+        """
+        existing = {column['name'] for column in db.inspect(db.engine).get_columns('matches')}
+        missing = [
+            column for column in (Match.unread_for_user1, Match.unread_for_user2, Match.last_message_id)
+            if column.name not in existing
+        ]
+        if not missing:
+            return []
+        
+        for column in missing:
+            ddl = f'ALTER TABLE matches ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}'
+            if column.server_default is not None:
+                ddl += f' NOT NULL DEFAULT {column.server_default.arg}'
+            db.session.execute(db.text(ddl))
+        
+        def unread_from(sender_id):
+            return select(db.func.count(Message.id)).where(
+                Message.match_id == Match.id,
+                Message.sender_id == sender_id,
+                Message.is_read == False
+            ).scalar_subquery()
+        
+        db.session.execute(
+            update(Match).values(
+                unread_for_user1=unread_from(Match.user2_id),
+                unread_for_user2=unread_from(Match.user1_id),
+                last_message_id=select(Message.id).where(
+                    Message.match_id == Match.id
+                ).order_by(Message.created_at.desc(), Message.id.desc()).limit(1).scalar_subquery()
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return [column.name for column in missing]
+    
+    def unread_count_for(self, user_id):
+        """Number of messages in this match the given user hasn't read."""
+        if self.user1_id == user_id:
+            return self.unread_for_user1
+        return self.unread_for_user2
+    
+    def mark_read_by(self, user_id):
+        """Mark the other user's unread messages as read for ``user_id``.
+        
+        Issues bulk UPDATEs for the messages and this match's unread counter
+        and returns the number of messages changed. The caller is
+        responsible for committing.
+        """
+        marked = Message.query.filter(
+            and_(
+                Message.match_id == self.id,
+                Message.sender_id != user_id,
+                Message.is_read == False
+            )
+        ).update({'is_read': True}, synchronize_session=False)
+        if marked:
+            counter = 'unread_for_user1' if self.user1_id == user_id else 'unread_for_user2'
+            Match.query.filter_by(id=self.id).update({counter: 0}, synchronize_session=False)
+        return marked
+    
+    def get_messages(self, limit=50, options=()):
+        """Get the most recent messages for this match, oldest first.
+        
+        ``options`` are ORM loader options applied to the query.
+        """
+        # Scan the (match_id, created_at) index backwards so only ``limit``
+        # rows are read, then restore chronological order
+        messages = Message.query.options(*options).filter_by(match_id=self.id).order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()
+        return list(reversed(messages))
     
     def __repr__(self):
         return f'<Match {self.user1_id} <-> {self.user2_id}>'
@@ -187,8 +422,38 @@ class Message(db.Model):
     match_id = db.Column(db.Integer, db.ForeignKey('matches.id'), nullable=False)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    is_read = db.Column(db.Boolean, default=False, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), server_default=db.func.current_timestamp())
+    is_read = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    
+    # Unread messages only (read ones are the bulk of the table and never
+    # hit the unread filters), and ordered history scans per match
+    __table_args__ = (
+        db.Index('ix_message_unread', 'match_id', 'sender_id',
+                 sqlite_where=is_read == db.false(), postgresql_where=is_read == db.false()),
+        db.Index('ix_message_match_created', 'match_id', 'created_at'),
+    )
+    
+    @staticmethod
+    def create(match_id, sender_id, content):
+        """Add a message and update its match's unread and last-message columns.
+        
+        The message is flushed so its id is available; the match is updated
+        with a single UPDATE in the same transaction. The caller is
+        responsible for committing.
+        """
+        message = Message(match_id=match_id, sender_id=sender_id, content=content)
+        db.session.add(message)
+        db.session.flush()
+        
+        # Bump the recipient's counter, whichever side of the pair they are
+        db.session.execute(
+            update(Match).where(Match.id == match_id).values(
+                unread_for_user1=Match.unread_for_user1 + case((Match.user2_id == sender_id, 1), else_=0),
+                unread_for_user2=Match.unread_for_user2 + case((Match.user1_id == sender_id, 1), else_=0),
+                last_message_id=message.id
+            ).execution_options(synchronize_session=False)
+        )
+        return message
     
     def __repr__(self):
         return f'<Message from:{self.sender_id} in match:{self.match_id}>'
\ No newline at end of file
@@ -3,7 +3,7 @@ Authentication routes for user registration, login, and logout.
 """
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_user, logout_user, login_required, current_user
-from models import db, User, Profile
+from models import db, User
 from forms import RegistrationForm, LoginForm
 
 auth_bp = Blueprint('auth', __name__)
@@ -18,25 +18,18 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         # Check if user already exists
-        existing_user = User.query.filter_by(email=form.email.data).first()
+        existing_user = User.get_by_email(form.email.data)
         if existing_user:
             flash('Email already registered. Please use a different email or login.', 'danger')
             return render_template('register.html', form=form)
         
-        # Create new user
+        # Create new user; an empty profile is attached automatically
         user = User(email=form.email.data)
         user.set_password(form.password.data)
+        user.profile.name = form.name.data
         
         try:
             db.session.add(user)
-            db.session.flush()  # Get the user ID
-            
-            # Create initial profile
-            profile = Profile(
-                user_id=user.id,
-                name=form.name.data
-            )
-            db.session.add(profile)
             db.session.commit()
             
             flash('Registration successful! Please login.', 'success')
@@ -58,9 +51,13 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        user = User.get_by_email(form.email.data)
         
         if user and user.check_password(form.password.data):
+            # Persist the upgraded hash if check_password rehashed it
+            if db.session.is_modified(user):
+                db.session.commit()
+            
             login_user(user)
             flash(f'Welcome back, {user.profile.name if user.profile else user.email}!', 'success')
             
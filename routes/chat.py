@@ -3,9 +3,11 @@ Chat routes for messaging between matched users.
 """
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
-from models import db, User, Match, Message
+from models import db, User, Profile, Match, Message
 from forms import MessageForm
-from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from routes.loading import strict_load_options
 
 chat_bp = Blueprint('chat', __name__)
 
@@ -14,7 +16,7 @@ chat_bp = Blueprint('chat', __name__)
 @login_required
 def chat(match_id):
     """Chat page for a specific match."""
-    match = Match.query.get_or_404(match_id)
+    match = db.get_or_404(Match, match_id)
     
     # Verify current user is part of this match
     if current_user.id not in [match.user1_id, match.user2_id]:
@@ -27,24 +29,17 @@ def chat(match_id):
         flash('Chat partner not found.', 'danger')
         return redirect(url_for('match.view_matches'))
     
-    # Get messages
-    messages = match.get_messages()
-    
-    # Mark messages from other user as read
-    unread_messages = Message.query.filter(
-        and_(
-            Message.match_id == match_id,
-            Message.sender_id != current_user.id,
-            Message.is_read == False
-        )
-    ).all()
-    
-    for message in unread_messages:
-        message.is_read = True
-    
-    if unread_messages:
+    # Mark messages from other user as read with bulk UPDATEs. This runs
+    # before loading messages so the commit doesn't expire them mid-render.
+    marked = match.mark_read_by(current_user.id)
+    if marked:
         db.session.commit()
     
+    # Get messages, with senders and their profiles loaded eagerly
+    messages = match.get_messages(options=strict_load_options(
+        joinedload(Message.sender).joinedload(User.profile)
+    ))
+    
     form = MessageForm()
     
     return render_template('chat.html', 
@@ -59,73 +54,110 @@ def chat(match_id):
 @login_required
 def send_message(match_id):
     """Send a message in a chat."""
-    match = Match.query.get_or_404(match_id)
+    match = db.get_or_404(Match, match_id)
     
     # Verify current user is part of this match
     if current_user.id not in [match.user1_id, match.user2_id]:
         return jsonify({'error': 'Access denied'}), 403
     
+    if request.is_json:
+        return _send_json_message(match_id)
+    
     form = MessageForm()
     if form.validate_on_submit():
         try:
-            message = Message(
-                match_id=match_id,
-                sender_id=current_user.id,
-                content=form.content.data.strip() if form.content.data else ''
+            Message.create(
+                match_id,
+                current_user.id,
+                form.content.data.strip() if form.content.data else ''
             )
-            
-            db.session.add(message)
             db.session.commit()
             
-            if request.is_json:
-                return jsonify({
-                    'success': True,
-                    'message': {
-                        'id': message.id,
-                        'content': message.content,
-                        'sender_id': message.sender_id,
-                        'created_at': message.created_at.isoformat()
-                    }
-                })
-            else:
-                flash('Message sent!', 'success')
-                return redirect(url_for('chat.chat', match_id=match_id))
+            flash('Message sent!', 'success')
+            return redirect(url_for('chat.chat', match_id=match_id))
                 
         except Exception as e:
             db.session.rollback()
-            if request.is_json:
-                return jsonify({'error': 'Failed to send message'}), 500
-            else:
-                flash('Failed to send message. Please try again.', 'danger')
+            flash('Failed to send message. Please try again.', 'danger')
     
-    if request.is_json:
+    return redirect(url_for('chat.chat', match_id=match_id))
+
+
+def _send_json_message(match_id):
+    """Send a message posted as JSON by the chat client.
+    
+    Skips building a MessageForm: CSRFProtect has already checked the
+    X-CSRFToken header for this POST, so only the content needs checking.
+    """
+    data = request.get_json(silent=True)
+    content = data.get('content') if isinstance(data, dict) else None
+    if not isinstance(content, str):
+        return jsonify({'error': 'Invalid message data'}), 400
+    content = content.strip()
+    
+    # Same bounds as MessageForm.content
+    if not 1 <= len(content) <= 1000:
         return jsonify({'error': 'Invalid message data'}), 400
-    else:
-        return redirect(url_for('chat.chat', match_id=match_id))
+    
+    try:
+        # Message.create flushes, so the id and server-side created_at are
+        # available; build the response before commit expires the instance
+        message = Message.create(match_id, current_user.id, content)
+        message_data = {
+            'id': message.id,
+            'content': message.content,
+            'sender_id': message.sender_id,
+            'created_at': message.created_at
+        }
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to send message'}), 500
+    
+    return jsonify({'success': True, 'message': message_data})
 
 
 @chat_bp.route('/chat/<int:match_id>/messages')
 @login_required
 def get_messages(match_id):
     """Get messages for a chat (API endpoint)."""
-    match = Match.query.get_or_404(match_id)
+    match = db.get_or_404(Match, match_id)
     
     # Verify current user is part of this match
     if current_user.id not in [match.user1_id, match.user2_id]:
         return jsonify({'error': 'Access denied'}), 403
     
-    messages = match.get_messages()
-    messages_data = []
-    
-    for message in messages:
-        messages_data.append({
-            'id': message.id,
-            'content': message.content,
-            'sender_id': message.sender_id,
-            'sender_name': message.sender.profile.name if message.sender.profile else message.sender.email,
-            'created_at': message.created_at.isoformat(),
-            'is_read': message.is_read
-        })
+    # A chat only has two participants, so resolve both display names once
+    # instead of joining users and profiles onto every message row.
+    name_by_id = dict(db.session.query(
+        User.id,
+        func.coalesce(Profile.name, User.email)
+    ).outerjoin(Profile, Profile.user_id == User.id).filter(
+        User.id.in_([match.user1_id, match.user2_id])
+    ).all())
+    
+    # Select plain columns rather than ORM objects; the JSON response
+    # doesn't need identity-mapped Message instances.
+    rows = db.session.query(
+        Message.id,
+        Message.content,
+        Message.sender_id,
+        Message.created_at,
+        Message.is_read
+    ).filter(
+        Message.match_id == match_id
+    ).order_by(Message.created_at.desc(), Message.id.desc()).limit(50).all()
+    rows.reverse()
+    
+    messages_data = [{
+        'id': row.id,
+        'content': row.content,
+        'sender_id': row.sender_id,
+        'sender_name': name_by_id.get(row.sender_id),
+        'created_at': row.created_at,
+        'is_read': row.is_read
+    } for row in rows]
     
     return jsonify(messages_data)
 
@@ -134,7 +166,7 @@ def get_messages(match_id):
 @login_required
 def mark_messages_read(match_id):
     """Mark all messages in a chat as read."""
-    match = Match.query.get_or_404(match_id)
+    match = db.get_or_404(Match, match_id)
     
     # Verify current user is part of this match
     if current_user.id not in [match.user1_id, match.user2_id]:
@@ -142,20 +174,10 @@ def mark_messages_read(match_id):
     
     try:
         # Mark all unread messages from the other user as read
-        unread_messages = Message.query.filter(
-            and_(
-                Message.match_id == match_id,
-                Message.sender_id != current_user.id,
-                Message.is_read == False
-            )
-        ).all()
-        
-        for message in unread_messages:
-            message.is_read = True
-        
+        marked = match.mark_read_by(current_user.id)
         db.session.commit()
         
-        return jsonify({'success': True, 'marked_count': len(unread_messages)})
+        return jsonify({'success': True, 'marked_count': marked})
         
     except Exception as e:
         db.session.rollback()
@@ -167,20 +189,14 @@ def mark_messages_read(match_id):
 @login_required
 def get_chat_info(match_id):
     """Get chat information (for real-time features)."""
-    match = Match.query.get_or_404(match_id)
+    match = db.get_or_404(Match, match_id)
     
     # Verify current user is part of this match
     if current_user.id not in [match.user1_id, match.user2_id]:
         return jsonify({'error': 'Access denied'}), 403
     
     other_user = match.get_other_user(current_user.id)
-    unread_count = Message.query.filter(
-        and_(
-            Message.match_id == match_id,
-            Message.sender_id != current_user.id,
-            Message.is_read == False
-        )
-    ).count()
+    unread_count = match.unread_count_for(current_user.id)
     
     return jsonify({
         'match_id': match.id,
@@ -189,5 +205,5 @@ def get_chat_info(match_id):
             'name': other_user.profile.name if other_user.profile else other_user.email,
         },
         'unread_count': unread_count,
-        'created_at': match.created_at.isoformat()
+        'created_at': match.created_at
     })
\ No newline at end of file
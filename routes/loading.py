@@ -0,0 +1,18 @@
+"""
+ORM loader options shared by the route blueprints.
+"""
+from flask import current_app
+from sqlalchemy.orm import raiseload
+
+
+def strict_load_options(*options):
+    """Return loader options, adding raiseload('*') in debug and testing.
+    
+    Listing queries load everything their templates need up front; in
+    development and tests any other relationship access (e.g. a template
+    touching message.match) raises instead of silently issuing one SELECT
+    per row.
+    """
+    if current_app.debug or current_app.testing:
+        return (*options, raiseload('*'))
+    return options
@@ -1,29 +1,122 @@
 """
 Matching routes for liking users, viewing matches, and match discovery.
 """
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+import base64
+import orjson
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, Response, stream_with_context, abort
 from flask_login import login_required, current_user
 from models import db, User, Profile, Like, Match, Message
-from sqlalchemy import and_, or_, func
+from tasks import send_match_notification
+from extensions import cache
+from sqlalchemy import and_, or_, select, delete, exists, bindparam
+from sqlalchemy.orm import joinedload
+from routes.loading import strict_load_options
 
 match_bp = Blueprint('match', __name__)
 
+DISCOVER_CACHE_TIMEOUT = 45
+DISCOVER_FEED_SIZE = 20
+MATCHES_PAGE_SIZE = 20
+
+# Statements used by unlike_user, built once at import and executed with
+# {'me': ..., 'them': ...} parameters
+_DELETE_LIKE_STMT = delete(Like).where(
+    Like.user_id == bindparam('me'),
+    Like.liked_user_id == bindparam('them')
+).returning(Like.id)
+
+# The pair's match, unless the other user still likes "me"
+_STALE_PAIR_MATCH_IDS = select(Match.id).where(
+    or_(
+        and_(Match.user1_id == bindparam('me'), Match.user2_id == bindparam('them')),
+        and_(Match.user1_id == bindparam('them'), Match.user2_id == bindparam('me'))
+    ),
+    ~exists().where(
+        Like.user_id == bindparam('them'),
+        Like.liked_user_id == bindparam('me')
+    )
+)
+_DELETE_STALE_MESSAGES_STMT = delete(Message).where(Message.match_id.in_(_STALE_PAIR_MATCH_IDS))
+_DELETE_STALE_MATCH_STMT = delete(Match).where(Match.id.in_(_STALE_PAIR_MATCH_IDS))
+
+
+def _wants_ndjson():
+    """Whether the client prefers newline-delimited JSON over a JSON array."""
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def _ndjson_response(items):
+    """Stream items as newline-delimited JSON, encoding one at a time."""
+    def generate():
+        for item in items:
+            yield orjson.dumps(item, default=current_app.json.default) + b'\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def _discover_cache_key(user_id):
+    return f'discover:{user_id}'
+
+
+def _get_discover_ids(user_id):
+    """Return the ids of users to show in a user's discover feed.
+    
+    The candidate query is cached briefly per user so repeated swipes don't
+    rerun it; like_user and unlike_user drop the entry so a just-liked user
+    doesn't reappear.
+    """
+    key = _discover_cache_key(user_id)
+    user_ids = cache.get(key)
+    if user_ids is not None:
+        return user_ids
+    
+    # Get users that current user hasn't liked and aren't themselves.
+    # Likes are anti-joined: a user with no matching like row gets NULLs.
+    user_ids = list(db.session.scalars(
+        select(User.id).join(User.profile).outerjoin(
+            Like, and_(Like.liked_user_id == User.id, Like.user_id == user_id)
+        ).where(
+            User.id != user_id,  # Not themselves
+            Like.id.is_(None),  # Haven't liked already
+            User.active == True,  # User is active
+            Profile.name != ''  # Has a name in profile
+        ).limit(DISCOVER_FEED_SIZE)
+    ))
+    cache.set(key, user_ids, timeout=DISCOVER_CACHE_TIMEOUT)
+    return user_ids
+
+
+def _load_discover_users(user_ids):
+    """Load users with their profiles in one query, keeping the feed order."""
+    if not user_ids:
+        return []
+    users = db.session.scalars(
+        select(User).options(*strict_load_options(
+            joinedload(User.profile)
+        )).where(User.id.in_(user_ids))
+    ).unique().all()
+    position = {user_id: index for index, user_id in enumerate(user_ids)}
+    return sorted(users, key=lambda user: position[user.id])
+
+
+def _encode_match_cursor(match):
+    """Encode a match's stored (created_at, id) as an opaque pagination cursor."""
+    raw = f'{match.created_at_stored},{match.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_match_cursor(cursor):
+    """Decode a cursor from _encode_match_cursor; raises ValueError if malformed."""
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, match_id = raw.rsplit(',', 1)
+    return created_at, int(match_id)
+
 
 @match_bp.route('/discover')
 @login_required
 def discover():
     """Discover page showing potential matches."""
-    # Get users that current user hasn't liked and aren't themselves
-    liked_user_ids = db.session.query(Like.liked_user_id).filter_by(user_id=current_user.id).subquery()
-    
-    potential_matches = db.session.query(User).join(Profile).filter(
-        and_(
-            User.id != current_user.id,  # Not themselves
-            User.id.notin_(liked_user_ids),  # Haven't liked already
-            User.active == True,  # User is active
-            Profile.name != ''  # Has a name in profile
-        )
-    ).limit(20).all()
+    potential_matches = _load_discover_users(_get_discover_ids(current_user.id))
     
     return render_template('discover.html', users=potential_matches)
 
@@ -35,7 +128,10 @@ def like_user(user_id):
     if user_id == current_user.id:
         return jsonify({'error': 'Cannot like yourself'}), 400
     
-    target_user = User.query.get_or_404(user_id)
+    # The profile is joined-loaded with the user; read the name now, since
+    # the commit in create_like_and_check_match expires target_user
+    target_user = db.get_or_404(User, user_id)
+    target_name = target_user.profile.name if target_user.profile else target_user.email
     
     # Create like and check for match
     like, match_created = Like.create_like_and_check_match(current_user.id, user_id)
@@ -43,13 +139,16 @@ def like_user(user_id):
     if like is None:
         return jsonify({'error': 'Invalid like operation'}), 400
     
+    cache.delete(_discover_cache_key(current_user.id))
+    
     response_data = {
         'liked': True,
         'match_created': match_created
     }
     
     if match_created:
-        response_data['message'] = f"It's a match with {target_user.profile.name}!"
+        response_data['message'] = f"It's a match with {target_name}!"
+        send_match_notification.delay(current_user.id, user_id)
     
     return jsonify(response_data)
 
@@ -57,67 +156,76 @@ def like_user(user_id):
 @match_bp.route('/matches')
 @login_required
 def view_matches():
-    """View all matches for current user."""
-    matches = current_user.get_matches()
+    """View current user's matches, one page at a time.
+    
+    Pages are keyed by the last match shown, passed back as ``?cursor=``.
+    """
+    before = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            before = _decode_match_cursor(cursor)
+        except ValueError:
+            abort(400)
+    
+    # Both users and their profiles are joined-loaded with each match;
+    # matches come back newest first. One extra row tells us whether
+    # there is a next page.
+    matches = current_user.get_matches(options=strict_load_options(
+        joinedload(Match.user1).joinedload(User.profile),
+        joinedload(Match.user2).joinedload(User.profile)
+    ), before=before, limit=MATCHES_PAGE_SIZE + 1)
+    next_cursor = None
+    if len(matches) > MATCHES_PAGE_SIZE:
+        matches = matches[:MATCHES_PAGE_SIZE]
+        next_cursor = _encode_match_cursor(matches[-1])
+    
+    # Unread counts and the latest message id are kept on each match, so
+    # only the latest messages themselves need fetching, by primary key
+    last_message_ids = [match.last_message_id for match in matches if match.last_message_id]
+    latest_by_match = {}
+    if last_message_ids:
+        latest_by_match = {
+            message.match_id: message
+            for message in Message.query.filter(Message.id.in_(last_message_ids))
+        }
     
     # Get match details with other user info
     match_details = []
     for match in matches:
         other_user = match.get_other_user(current_user.id)
         if other_user and other_user.profile:
-            # Get latest message for preview
-            latest_messages = match.get_messages(limit=1)
-            latest_message = latest_messages[0] if latest_messages else None
-            
             match_details.append({
                 'match': match,
                 'other_user': other_user,
                 'other_profile': other_user.profile,
-                'latest_message': latest_message,
-                'unread_count': Message.query.filter(
-                    and_(
-                        Message.match_id == match.id,
-                        Message.sender_id != current_user.id,
-                        Message.is_read == False
-                    )
-                ).count()
+                'latest_message': latest_by_match.get(match.id),
+                'unread_count': match.unread_count_for(current_user.id)
             })
     
-    # Sort by most recent activity
-    match_details.sort(key=lambda x: x['match'].created_at, reverse=True)
-    
-    return render_template('matches.html', matches=match_details)
+    return render_template('matches.html', matches=match_details, next_cursor=next_cursor)
 
 
 @match_bp.route('/unlike/<int:user_id>', methods=['POST'])
 @login_required
 def unlike_user(user_id):
     """Unlike a user (remove like)."""
-    like = Like.query.filter_by(user_id=current_user.id, liked_user_id=user_id).first()
-    
-    if not like:
-        return jsonify({'error': 'Like not found'}), 404
-    
     try:
-        # Remove the like
-        db.session.delete(like)
+        params = {'me': current_user.id, 'them': user_id}
+        
+        # Remove the like, learning whether it existed from RETURNING
+        deleted_like_id = db.session.execute(_DELETE_LIKE_STMT, params).scalar()
         
-        # Check if there was a match and remove it
-        match = Match.query.filter(
-            or_(
-                and_(Match.user1_id == current_user.id, Match.user2_id == user_id),
-                and_(Match.user1_id == user_id, Match.user2_id == current_user.id)
-            )
-        ).first()
+        if deleted_like_id is None:
+            return jsonify({'error': 'Like not found'}), 404
         
-        if match:
-            # Check if the other user still likes current user
-            reverse_like = Like.query.filter_by(user_id=user_id, liked_user_id=current_user.id).first()
-            if not reverse_like:
-                # No mutual like anymore, remove the match
-                db.session.delete(match)
+        # Remove the match (and its messages) unless the other user still
+        # likes current user
+        db.session.execute(_DELETE_STALE_MESSAGES_STMT, params)
+        db.session.execute(_DELETE_STALE_MATCH_STMT, params)
         
         db.session.commit()
+        cache.delete(_discover_cache_key(current_user.id))
         return jsonify({'success': True, 'unliked': True})
         
     except Exception as e:
@@ -130,16 +238,8 @@ def unlike_user(user_id):
 @login_required
 def get_potential_matches():
     """API endpoint to get potential matches."""
-    liked_user_ids = db.session.query(Like.liked_user_id).filter_by(user_id=current_user.id).subquery()
-    
-    potential_matches = db.session.query(User).join(Profile).filter(
-        and_(
-            User.id != current_user.id,
-            User.id.notin_(liked_user_ids),
-            User.active == True,
-            Profile.name != ''
-        )
-    ).limit(10).all()
+    # Shares the cached discover feed; the API returns its first page
+    potential_matches = _load_discover_users(_get_discover_ids(current_user.id)[:10])
     
     matches_data = []
     for user in potential_matches:
@@ -148,7 +248,7 @@ def get_potential_matches():
             'name': user.profile.name,
             'age': user.profile.age,
             'bio': user.profile.bio,
-            'tags': user.profile.get_tags_list(),
+            'tags': user.profile.tags_list,
             'location': user.profile.location
         })
     
@@ -158,22 +258,39 @@ def get_potential_matches():
 @match_bp.route('/api/matches')
 @login_required
 def get_matches_api():
-    """API endpoint to get user's matches."""
-    matches = current_user.get_matches()
-    matches_data = []
+    """API endpoint to get user's matches.
     
-    for match in matches:
-        other_user = match.get_other_user(current_user.id)
-        if other_user and other_user.profile:
-            matches_data.append({
-                'match_id': match.id,
+    Returns a JSON array by default, or one JSON object per line when the
+    client asks for application/x-ndjson.
+    """
+    # Each match with the other user's profile fields in one SELECT, newest
+    # first like the matches page; plain column rows, so no ORM entities or
+    # relationship loads are involved
+    rows = db.session.execute(
+        select(
+            Match.id, Match.created_at,
+            Profile.user_id, Profile.name, Profile.age, Profile.bio
+        ).join(Profile, or_(
+            and_(Match.user1_id == current_user.id, Profile.user_id == Match.user2_id),
+            and_(Match.user2_id == current_user.id, Profile.user_id == Match.user1_id)
+        )).where(
+            or_(Match.user1_id == current_user.id, Match.user2_id == current_user.id)
+        ).order_by(Match.created_at.desc(), Match.id.desc())
+    )
+    
+    def iter_matches():
+        for match_id, created_at, user_id, name, age, bio in rows:
+            yield {
+                'match_id': match_id,
                 'other_user': {
-                    'id': other_user.id,
-                    'name': other_user.profile.name,
-                    'age': other_user.profile.age,
-                    'bio': other_user.profile.bio
+                    'id': user_id,
+                    'name': name,
+                    'age': age,
+                    'bio': bio
                 },
-                'created_at': match.created_at.isoformat()
-            })
+                'created_at': created_at
+            }
     
-    return jsonify(matches_data)
\ No newline at end of file
+    if _wants_ndjson():
+        return _ndjson_response(iter_matches())
+    return jsonify(list(iter_matches()))
\ No newline at end of file
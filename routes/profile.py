@@ -1,24 +1,70 @@
 """
 Profile management routes for viewing and editing user profiles.
 """
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+import hashlib
+import re
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, abort, make_response, current_app
 from flask_login import login_required, current_user
-from models import db, User, Profile
+from models import db, User, Profile, Like, Match
+from sqlalchemy import select, exists, and_, or_
 from forms import ProfileForm
+from extensions import cache
 
 profile_bp = Blueprint('profile', __name__)
 
+PROFILE_CACHE_TIMEOUT = 600
+
+# Splits a tag string on commas, swallowing surrounding whitespace
+TAG_SEPARATOR = re.compile(r'\s*,\s*')
+
+
+def _profile_cache_key(user_id):
+    return f'profile:{user_id}'
+
+
+def _get_profile_dict(user_id):
+    """Return a user's public profile data, served from the cache when possible.
+    
+    Returns None if the user or their profile doesn't exist. Entries are
+    dropped by edit_profile when the owner saves changes.
+    """
+    key = _profile_cache_key(user_id)
+    profile_data = cache.get(key)
+    if profile_data is not None:
+        return profile_data
+    
+    profile = Profile.query.filter_by(user_id=user_id).first()
+    if not profile:
+        return None
+    
+    profile_data = {
+        'id': user_id,
+        'name': profile.name,
+        'age': profile.age,
+        'gender': profile.gender,
+        'bio': profile.bio,
+        'tags': profile.tags_list,
+        'location': profile.location,
+        'updated_at': profile.updated_at
+    }
+    cache.set(key, profile_data, timeout=PROFILE_CACHE_TIMEOUT)
+    return profile_data
+
+
+def _profile_etag(profile_data):
+    """Build an ETag for a profile's API response from its content.
+    
+    Hashing the data rather than using updated_at keeps edits made within
+    the same second (the timestamp's resolution) distinguishable.
+    """
+    return hashlib.sha1(current_app.json.dumps(profile_data).encode()).hexdigest()
+
 
 @profile_bp.route('/profile')
 @login_required
 def view_profile():
     """View current user's profile."""
-    if not current_user.profile:
-        # Create empty profile if it doesn't exist
-        profile = Profile(user_id=current_user.id, name='')
-        db.session.add(profile)
-        db.session.commit()
-    
+    # Profiles are created at signup, so viewing never writes
     return render_template('profile.html', profile=current_user.profile)
 
 
@@ -26,16 +72,15 @@ def view_profile():
 @login_required
 def edit_profile():
     """Edit current user's profile."""
-    if not current_user.profile:
-        # Create empty profile if it doesn't exist
-        profile = Profile(user_id=current_user.id, name='')
-        db.session.add(profile)
-        db.session.commit()
-    
     form = ProfileForm(obj=current_user.profile)
     
     if form.validate_on_submit():
         try:
+            # Profiles are created at signup; only a legacy account that
+            # predates that gets one here, on its first save
+            if not current_user.profile:
+                current_user.profile = Profile(name='')
+            
             # Update profile fields
             current_user.profile.name = form.name.data
             current_user.profile.age = form.age.data
@@ -45,13 +90,15 @@ def edit_profile():
             
             # Handle tags
             if form.tags.data:
-                # Convert comma-separated string to clean tags
-                tags_list = [tag.strip() for tag in form.tags.data.split(',') if tag.strip()]
+                # Convert comma-separated string to clean, de-duplicated tags
+                tags = (tag for tag in TAG_SEPARATOR.split(form.tags.data.strip()) if tag)
+                tags_list = list(dict.fromkeys(tags))
                 current_user.profile.set_tags_from_list(tags_list)
             else:
                 current_user.profile.tags = ''
             
             db.session.commit()
+            cache.delete(_profile_cache_key(current_user.id))
             flash('Profile updated successfully!', 'success')
             return redirect(url_for('profile.view_profile'))
             
@@ -69,22 +116,35 @@ def view_other_profile(user_id):
     if user_id == current_user.id:
         return redirect(url_for('profile.view_profile'))
     
-    user = User.query.get_or_404(user_id)
-    if not user.profile:
+    profile_data = _get_profile_dict(user_id)
+    if profile_data is None:
+        if db.session.get(User, user_id) is None:
+            abort(404)
         flash('User profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    # Check if current user has already liked this user
-    has_liked = current_user.has_liked(user_id)
+        return redirect(url_for('index'))
     
-    # Check if they have a match
-    match = current_user.get_match_with_user(user_id)
+    # Check for an existing like and a match in a single round-trip
+    row = db.session.execute(select(
+        exists().where(
+            Like.user_id == current_user.id,
+            Like.liked_user_id == user_id
+        ).label('liked'),
+        select(Match.id).where(
+            or_(
+                and_(Match.user1_id == current_user.id, Match.user2_id == user_id),
+                and_(Match.user1_id == user_id, Match.user2_id == current_user.id)
+            )
+        ).scalar_subquery().label('match_id')
+    )).one()
     
+    # Not ETag-tagged like the API: the page embeds a CSRF token, which a
+    # cached copy would keep past its expiry
     return render_template('view_profile.html', 
-                         profile=user.profile, 
-                         user=user,
-                         has_liked=has_liked, 
-                         has_match=match is not None)
+                         profile=profile_data, 
+                         user_id=user_id,
+                         has_liked=row.liked, 
+                         has_match=row.match_id is not None,
+                         match_id=row.match_id)
 
 
 # API endpoint for profile data (for future extensions)
@@ -92,18 +152,16 @@ def view_other_profile(user_id):
 @login_required
 def get_profile_api(user_id):
     """API endpoint to get user profile data."""
-    user = User.query.get_or_404(user_id)
-    if not user.profile:
+    profile_data = _get_profile_dict(user_id)
+    if profile_data is None:
         return jsonify({'error': 'Profile not found'}), 404
     
-    profile_data = {
-        'id': user.id,
-        'name': user.profile.name,
-        'age': user.profile.age,
-        'gender': user.profile.gender,
-        'bio': user.profile.bio,
-        'tags': user.profile.get_tags_list(),
-        'location': user.profile.location
-    }
-    
-    return jsonify(profile_data)
\ No newline at end of file
+    # Clients polling a profile get a 304 until its owner edits it; the
+    # ETag is weak since compression changes the bytes on the wire
+    etag = _profile_etag(profile_data)
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(profile_data)
+    response.set_etag(etag, weak=True)
+    return response
\ No newline at end of file
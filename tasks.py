@@ -0,0 +1,49 @@
+"""
+Background tasks for side effects that shouldn't hold up HTTP responses.
+Run a worker with: celery -A tasks worker
+"""
+import os
+import logging
+from celery import Celery
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+broker_url = os.environ.get('CELERY_BROKER_URL')
+
+celery = Celery('matchapp', broker=broker_url or 'memory://')
+celery.conf.update(
+    task_ignore_result=True,
+    # Without a broker (local development) tasks run inline
+    task_always_eager=not broker_url,
+)
+
+
+def _task_app():
+    """Return the Flask app a task should run against.
+    
+    Eager tasks run inside the request that queued them and reuse its app;
+    workers import the module-level app (here, to avoid a circular import).
+    """
+    if has_app_context():
+        return current_app._get_current_object()
+    from app import app
+    return app
+
+
+@celery.task(ignore_result=True)
+def send_match_notification(user_a_id, user_b_id):
+    """Notify both users that they have matched."""
+    from models import db, User
+    
+    with _task_app().app_context():
+        user_a = db.session.get(User, user_a_id)
+        if not user_a:
+            return
+        match = user_a.get_match_with_user(user_b_id)
+        if not match:
+            # The match was removed before the task ran
+            return
+        
+        # Delivery (push, email, ...) plugs in here
+        logger.info('Match %s created between users %s and %s', match.id, user_a_id, user_b_id)
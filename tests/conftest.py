@@ -0,0 +1,79 @@
+"""
+Shared fixtures: an app on an in-memory database, logged-in clients and a
+SQL statement counter.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+    })
+    # Requests push their own app context, so Flask-Login's per-context
+    # user cache doesn't leak between clients; tests that use the database
+    # directly push one with ``app.app_context()``
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user with a named profile and return its id."""
+    def make_user(name, password='secret1'):
+        with app.app_context():
+            user = User(email=f'{name.lower()}@example.com')
+            user.set_password(password)
+            user.profile.name = name
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def login(app):
+    """Return a test client logged in as the given user."""
+    def login(user_id, password='secret1'):
+        client = app.test_client()
+        with app.app_context():
+            email = db.session.get(User, user_id).email
+        response = client.post('/login', data={'email': email, 'password': password})
+        assert response.status_code == 302
+        return client
+    return login
+
+
+@pytest.fixture
+def count_queries(app):
+    """Count the SQL statements executed inside a ``with`` block.
+    
+    Uses a ``before_cursor_execute`` listener on the engine, so statements
+    from every session and connection are seen.
+    """
+    @contextmanager
+    def count_queries():
+        statements = []
+        
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return count_queries
@@ -0,0 +1,40 @@
+"""
+JSON message sending.
+"""
+import pytest
+
+from models import db, Match
+
+
+@pytest.fixture
+def chat(app, make_user, login):
+    alice_id, bob_id = make_user('Alice'), make_user('Bob')
+    with app.app_context():
+        match = Match(user1_id=alice_id, user2_id=bob_id)
+        db.session.add(match)
+        db.session.commit()
+        url = f'/chat/{match.id}/send'
+    return login(alice_id), url
+
+
+def test_send_json_message(chat):
+    client, url = chat
+    response = client.post(url, json={'content': '  hello  '})
+    assert response.status_code == 200
+    assert response.get_json()['message']['content'] == 'hello'
+
+
+@pytest.mark.parametrize('body', [
+    [1],
+    'hello',
+    {},
+    {'content': None},
+    {'content': 123},
+    {'content': '   '},
+    {'content': 'x' * 1001},
+])
+def test_send_json_message_rejects_invalid_data(chat, body):
+    client, url = chat
+    response = client.post(url, json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid message data'}
@@ -0,0 +1,21 @@
+"""
+The init-db command upgrading an existing database.
+"""
+from models import db
+
+
+def test_init_db_creates_missing_indexes(app):
+    with app.app_context():
+        db.session.execute(db.text('DROP INDEX ix_message_unread'))
+        db.session.execute(db.text('DROP INDEX ix_like_liked_user'))
+        db.session.commit()
+    
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    assert 'Created indexes: ix_like_liked_user, ix_message_unread.' in result.output
+    
+    with app.app_context():
+        names = {index['name'] for index in db.inspect(db.engine).get_indexes('messages')}
+    assert 'ix_message_unread' in names
+    
+    # Nothing left to create on a second run
+    assert 'Created indexes' not in app.test_cli_runner().invoke(args=['init-db']).output
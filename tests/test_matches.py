@@ -0,0 +1,94 @@
+"""
+Match listing: keyset pagination and the denormalized unread counters.
+"""
+import re
+
+from models import db, User, Match
+from routes.match import MATCHES_PAGE_SIZE
+
+
+def _names(response):
+    return re.findall(r'text-xl font-semibold">([^<]+)<', response.get_data(as_text=True))
+
+
+def _next_page(response):
+    found = re.search(r'href="(/matches\?cursor=[^"]+)"', response.get_data(as_text=True))
+    return found.group(1) if found else None
+
+
+def _match_many(user_id, count):
+    """Match a user with ``count`` new users, all created in the same second."""
+    for i in range(count):
+        other = User(email=f'other{i}@example.com', password_hash='unused')
+        other.profile.name = f'Other{i}'
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Match(user1_id=user_id, user2_id=other.id))
+    db.session.commit()
+
+
+def test_pages_cover_every_match_once(app, make_user, login):
+    user_id = make_user('Alice')
+    with app.app_context():
+        _match_many(user_id, MATCHES_PAGE_SIZE + 5)
+    client = login(user_id)
+    
+    seen = []
+    url = '/matches'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen += _names(response)
+        url = _next_page(response)
+    
+    assert len(seen) == MATCHES_PAGE_SIZE + 5
+    assert len(set(seen)) == len(seen)
+
+
+def test_cursor_survives_deleting_its_match(app, make_user, login):
+    user_id = make_user('Alice')
+    with app.app_context():
+        _match_many(user_id, MATCHES_PAGE_SIZE + 5)
+    client = login(user_id)
+    
+    first_page = client.get('/matches')
+    last_shown = _names(first_page)[-1]
+    with app.app_context():
+        other = User.query.filter_by(email=f'{last_shown.lower()}@example.com').one()
+        db.session.delete(Match.query.filter_by(user2_id=other.id).one())
+        db.session.commit()
+    
+    assert len(_names(client.get(_next_page(first_page)))) == 5
+
+
+def test_malformed_cursor_is_rejected(make_user, login):
+    client = login(make_user('Alice'))
+    assert client.get('/matches?cursor=not-a-cursor').status_code == 400
+
+
+def test_unread_counters_follow_sends_and_reads(app, make_user, login):
+    alice_id, bob_id = make_user('Alice'), make_user('Bob')
+    with app.app_context():
+        match = Match(user1_id=alice_id, user2_id=bob_id)
+        db.session.add(match)
+        db.session.commit()
+        chat = f'/chat/{match.id}'
+    alice, bob = login(alice_id), login(bob_id)
+    
+    for content in ('one', 'two'):
+        assert alice.post(f'{chat}/send', json={'content': content}).status_code == 200
+    assert bob.get(f'/api{chat}/info').get_json()['unread_count'] == 2
+    assert alice.get(f'/api{chat}/info').get_json()['unread_count'] == 0
+    assert 'two' in bob.get('/matches').get_data(as_text=True)
+    
+    assert bob.post(f'{chat}/mark-read').get_json()['marked_count'] == 2
+    assert bob.get(f'/api{chat}/info').get_json()['unread_count'] == 0
+
+
+def test_matches_api_lists_newest_first(app, make_user, login):
+    user_id = make_user('Alice')
+    with app.app_context():
+        _match_many(user_id, 3)
+    
+    match_ids = [row['match_id'] for row in login(user_id).get('/api/matches').get_json()]
+    assert match_ids == sorted(match_ids, reverse=True)
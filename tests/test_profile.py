@@ -0,0 +1,31 @@
+"""
+Profile API conditional requests.
+"""
+
+
+def test_profile_api_answers_304_until_the_profile_changes(make_user, login):
+    alice_id, bob_id = make_user('Alice'), make_user('Bob')
+    alice, bob = login(alice_id), login(bob_id)
+    
+    response = alice.get(f'/api/profile/{bob_id}')
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    
+    not_modified = alice.get(f'/api/profile/{bob_id}', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    
+    # Edited within the same second as the fetch above
+    assert bob.post('/profile/edit', data={'name': 'Robert'}).status_code == 302
+    
+    changed = alice.get(f'/api/profile/{bob_id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['name'] == 'Robert'
+
+
+def test_profile_page_is_not_etagged(make_user, login):
+    alice_id, bob_id = make_user('Alice'), make_user('Bob')
+    response = login(alice_id).get(f'/profile/{bob_id}')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
@@ -0,0 +1,55 @@
+"""
+Query budgets for the listing pages, to catch N+1 regressions.
+
+Budgets include the Flask-Login user lookup each request makes.
+"""
+import pytest
+from sqlalchemy import select
+
+from models import db, Like, Match
+
+
+@pytest.fixture
+def alice(app, make_user, login):
+    alice_id = make_user('Alice')
+    others = [make_user(name) for name in ('Bob', 'Carol', 'Dave')]
+    with app.app_context():
+        for other_id in others[:2]:
+            Like.create_like_and_check_match(alice_id, other_id)
+            Like.create_like_and_check_match(other_id, alice_id)
+        match_ids = list(db.session.scalars(select(Match.id).order_by(Match.id)))
+    assert len(match_ids) == 2
+    client = login(alice_id)
+    for match_id, content in zip(match_ids, ('hello', 'hi there')):
+        response = client.post(f'/chat/{match_id}/send', json={'content': content})
+        assert response.status_code == 200
+    return client, others, match_ids[0]
+
+
+@pytest.mark.parametrize('path, budget', [
+    ('/discover', 3),
+    ('/api/potential-matches', 3),
+    ('/matches', 3),
+    ('/api/matches', 2),
+    ('/chat/{match_id}', 4),
+    ('/chat/{match_id}/messages', 4),
+    ('/dashboard', 2),
+])
+def test_listing_query_budget(alice, count_queries, path, budget):
+    client, _, match_id = alice
+    with count_queries() as statements:
+        response = client.get(path.format(match_id=match_id))
+    assert response.status_code == 200
+    assert len(statements) <= budget, statements
+
+
+def test_profile_query_budget(alice, count_queries):
+    client, others, _ = alice
+    with count_queries() as statements:
+        assert client.get(f'/profile/{others[2]}').status_code == 200
+    assert len(statements) <= 3, statements
+    
+    # The profile data itself is cached after the first request
+    with count_queries() as statements:
+        assert client.get(f'/api/profile/{others[2]}').status_code == 200
+    assert len(statements) <= 1, statements